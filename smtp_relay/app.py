@@ -9,124 +9,704 @@ so we don't rely on any external SMTP service.
 from __future__ import annotations
 
 import asyncio
-import email
 import os
 import logging
-import smtplib
-from typing import List
+import re
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from email.parser import BytesHeaderParser
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
+import aiofiles
+import aiofiles.os
+import aiosmtplib
+import dns.asyncresolver
 import dns.resolver
 
 from aiosmtpd.controller import Controller
 from fastapi import FastAPI
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 import uvicorn
 
 MAIL_DIR = "/app/mail_store"
 logging.basicConfig(level=logging.INFO)
 
 
+@dataclass(frozen=True)
+class RelayConfig:
+    """Outbound relay settings, read once from the environment."""
+
+    host: Optional[str]
+    port: int
+    user: Optional[str]
+    password: Optional[str]
+    starttls: bool
+
+    @classmethod
+    def from_env(cls) -> "RelayConfig":
+        port = os.getenv("SMTP_RELAY_PORT")
+        return cls(
+            host=os.getenv("SMTP_RELAY_SERVER") or None,
+            port=int(port) if port else 0,
+            user=os.getenv("SMTP_RELAY_USERNAME") or None,
+            password=os.getenv("SMTP_RELAY_PASSWORD") or None,
+            starttls=os.getenv("SMTP_RELAY_STARTTLS", "1") in ("1", "true", "True"),
+        )
+
+
+RELAY = RelayConfig.from_env()
+
+PoolKey = Tuple[str, int, Optional[str]]
+
+
+class SMTPPool:
+    """Keep authenticated outbound SMTP sessions open between messages.
+
+    Connections are keyed by ``(host, port, user)``. A checked-in
+    connection is validated with ``NOOP`` and reset with ``RSET`` before it
+    is handed out again, so the TCP/STARTTLS/AUTH setup is only paid once
+    per key. At most ``max_per_key`` connections exist per key; further
+    callers wait until one is released. ``max_active`` additionally caps
+    checked-out connections across all keys; that slot is only taken once
+    the caller holds its key's slot, so callers queued behind one busy host
+    don't block everyone else. Connections idle for longer than
+    ``idle_timeout`` seconds are closed by a background task, which also
+    forgets keys that no longer have any connections or callers.
+    """
+
+    def __init__(
+        self,
+        max_per_key: int = 5,
+        idle_timeout: float = 100.0,
+        max_active: Optional[int] = None,
+    ):
+        self.max_per_key = max_per_key
+        self.idle_timeout = idle_timeout
+        self._active = asyncio.Semaphore(max_active) if max_active else None
+        self._idle: Dict[PoolKey, List[Tuple[aiosmtplib.SMTP, float]]] = {}
+        self._slots: Dict[PoolKey, asyncio.Semaphore] = {}
+        # Callers holding or waiting for a slot, per key.
+        self._users: Dict[PoolKey, int] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+    async def acquire(
+        self,
+        host: str,
+        port: int,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        *,
+        address: Optional[str] = None,
+        starttls: bool = False,
+        timeout: float = 30,
+    ) -> aiosmtplib.SMTP:
+        """Return a ready-to-use connection for ``(host, port, user)``.
+
+        ``address`` lets the caller connect to an already-resolved IP; TLS
+        is still verified against ``host``.
+        """
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.get_running_loop().create_task(self._reap())
+        key = (host, port, user)
+        slots = self._slots.setdefault(key, asyncio.Semaphore(self.max_per_key))
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            await slots.acquire()
+        except BaseException:
+            self._users[key] -= 1
+            raise
+        try:
+            if self._active is not None:
+                await self._active.acquire()
+        except BaseException:
+            slots.release()
+            self._users[key] -= 1
+            raise
+        try:
+            idle = self._idle.get(key, [])
+            while idle:
+                conn, _ = idle.pop()
+                try:
+                    await conn.noop()
+                    await conn.rset()
+                    return conn
+                except Exception:
+                    await self._close(conn)
+            conn = aiosmtplib.SMTP(
+                hostname=address or host,
+                port=port,
+                timeout=timeout,
+                local_hostname="local-relay",
+                start_tls=False,
+            )
+            await conn.connect()
+            try:
+                await conn.ehlo()
+                if starttls:
+                    await conn.starttls(server_hostname=host)
+                    await conn.ehlo()
+                if user and password:
+                    await conn.login(user, password)
+            except Exception:
+                await self._close(conn)
+                raise
+            return conn
+        except BaseException:
+            if self._active is not None:
+                self._active.release()
+            slots.release()
+            self._users[key] -= 1
+            raise
+
+    async def release(
+        self, key: PoolKey, conn: aiosmtplib.SMTP, reuse: bool = True
+    ) -> None:
+        """Return ``conn`` to the pool, or close it when ``reuse`` is false."""
+        if reuse and conn.is_connected:
+            self._idle.setdefault(key, []).append((conn, time.monotonic()))
+        else:
+            await self._close(conn)
+        if self._active is not None:
+            self._active.release()
+        self._slots[key].release()
+        self._users[key] -= 1
+
+    @asynccontextmanager
+    async def connection(
+        self,
+        host: str,
+        port: int,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        **kwargs,
+    ) -> AsyncIterator[aiosmtplib.SMTP]:
+        """Context manager around :meth:`acquire` / :meth:`release`.
+
+        A connection that raised while in use is closed rather than
+        returned to the pool, since its session state is unknown.
+        """
+        conn = await self.acquire(host, port, user, password, **kwargs)
+        reuse = False
+        try:
+            yield conn
+            reuse = True
+        finally:
+            await self.release((host, port, user), conn, reuse=reuse)
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(self.idle_timeout / 4)
+            cutoff = time.monotonic() - self.idle_timeout
+            stale = []
+            for idle in self._idle.values():
+                # Detach stale entries before awaiting anything, so an
+                # acquire() running during QUIT can't take one of them.
+                stale.extend(conn for conn, last_used in idle if last_used < cutoff)
+                idle[:] = [item for item in idle if item[1] >= cutoff]
+            # Drop keys nobody is using so hosts contacted once don't
+            # stay in the maps forever.
+            for key in list(self._slots):
+                if not self._idle.get(key) and not self._users.get(key):
+                    self._slots.pop(key, None)
+                    self._idle.pop(key, None)
+                    self._users.pop(key, None)
+            for conn in stale:
+                await self._close(conn)
+
+    @staticmethod
+    async def _close(conn: aiosmtplib.SMTP) -> None:
+        try:
+            await conn.quit()
+        except Exception:
+            conn.close()
+
+
+# Upper bound on outbound deliveries running at once, so a burst of
+# messages can't open an unbounded number of sockets.
+MAX_CONCURRENT_DELIVERIES = int(
+    os.getenv("MAX_CONCURRENT_DELIVERIES", str((os.cpu_count() or 4) * 8))
+)
+
+_pool = SMTPPool(max_active=MAX_CONCURRENT_DELIVERIES)
+
+
+class TokenBucket:
+    """Async token bucket allowing ``rate`` acquisitions per second.
+
+    Up to ``capacity`` tokens may be spent in a burst; callers beyond that
+    sleep until enough tokens have refilled.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+
+    async def acquire(self, tokens: float = 1) -> None:
+        # Reserve the tokens up front (the balance may go negative) and
+        # then sleep off the deficit. Nothing is awaited before the
+        # reservation, so callers queue in order without holding a lock.
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._last_refill) * self.rate
+        )
+        self._last_refill = now
+        self._tokens -= tokens
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+
+# Per-destination send rates, keyed by relay host or recipient domain and
+# configured as RATE_<NAME>=msgs_per_sec with dots/dashes as underscores
+# (e.g. RATE_SMTP_GMAIL_COM=2). RATE_DEFAULT applies to everything else;
+# destinations without a rate are not throttled.
+_limiters: Dict[str, Optional[TokenBucket]] = {}
+
+
+def _limiter_for(destination: str) -> Optional[TokenBucket]:
+    destination = destination.lower()
+    if destination not in _limiters:
+        env = "RATE_" + re.sub(r"[.-]", "_", destination).upper()
+        rate = os.getenv(env) or os.getenv("RATE_DEFAULT")
+        _limiters[destination] = (
+            TokenBucket(float(rate)) if rate and float(rate) > 0 else None
+        )
+    return _limiters[destination]
+
+
+async def _throttle(destination: str) -> None:
+    """Wait for a send slot towards ``destination`` if it is rate limited."""
+    bucket = _limiter_for(destination)
+    if bucket is not None:
+        await bucket.acquire()
+
+
+# DNS answers (MX and A) are cached for the record's TTL, capped at
+# DNS_CACHE_MAX_TTL. Concurrent misses for the same name share a single
+# in-flight query.
+DNS_CACHE_MAX_TTL = 900
+DNS_CACHE_MAX_SIZE = 10_000
+DnsKey = Tuple[str, str]
+_dns_cache: Dict[DnsKey, Tuple[float, List[str]]] = {}
+_dns_inflight: Dict[DnsKey, asyncio.Future] = {}
+
+
+def _make_resolver() -> dns.asyncresolver.Resolver:
+    """Build the process-wide resolver with short timeouts.
+
+    Only the nameservers in /etc/resolv.conf are used unless DNS_SERVERS
+    (comma separated) is set; those are then tried first. dnspython asks
+    nameservers one after another, so each one listed ahead of the system
+    resolver can use up to DNS_TIMEOUT of the DNS_LIFETIME budget.
+    """
+    resolver = dns.asyncresolver.Resolver(configure=True)
+    resolver.timeout = float(os.getenv("DNS_TIMEOUT", "2.0"))
+    resolver.lifetime = float(os.getenv("DNS_LIFETIME", "4.0"))
+    servers = os.getenv("DNS_SERVERS", "")
+    extra = [ns.strip() for ns in servers.split(",") if ns.strip()]
+    resolver.nameservers = list(dict.fromkeys(extra + list(resolver.nameservers)))
+    return resolver
+
+
+_resolver = _make_resolver()
+
+# Destinations known to be bad are skipped until their entry expires:
+# names that don't exist / have no records of the requested type for
+# BAD_DOMAIN_TTL seconds, and addresses that refused or timed out a
+# connection for BAD_HOST_TTL seconds.
+BAD_DOMAIN_TTL = 600
+BAD_HOST_TTL = 60
+_dns_negative: Dict[DnsKey, float] = {}
+_bad_hosts: Dict[Tuple[str, int], float] = {}
+
+
+class DestinationUnavailable(RuntimeError):
+    """Raised without trying when a destination is in a negative cache."""
+
+
+def _host_is_down(host: str, port: int) -> bool:
+    expiry = _bad_hosts.get((host, port))
+    if expiry is None:
+        return False
+    if time.monotonic() < expiry:
+        return True
+    del _bad_hosts[(host, port)]
+    return False
+
+
+def _mark_host_down(host: str, port: int, exc: BaseException) -> None:
+    if not _host_is_down(host, port):
+        logging.warning(
+            "Marking %s:%s down for %ss: %s", host, port, BAD_HOST_TTL, exc
+        )
+    _bad_hosts[(host, port)] = time.monotonic() + BAD_HOST_TTL
+
+
+def _is_connect_failure(exc: BaseException) -> bool:
+    """True for errors meaning the host itself is unreachable.
+
+    Only failures from ``connect()`` count: read timeouts, TLS errors and
+    mid-session disconnects say nothing about whether the host is down.
+    """
+    return isinstance(
+        exc, (aiosmtplib.SMTPConnectError, aiosmtplib.SMTPConnectTimeoutError)
+    )
+
+
+def _parse_answers(rdtype: str, answers) -> List[str]:
+    if rdtype == "MX":
+        # MX records are tuples (priority, host)
+        mx = sorted([(r.preference, str(r.exchange).rstrip(".")) for r in answers])
+        return [host for _, host in mx]
+    return [r.address for r in answers]
+
+
+async def _resolve_cached(name: str, rdtype: str) -> List[str]:
+    """Resolve ``name``/``rdtype`` via ``_dns_cache``.
+
+    MX answers come back as hostnames in priority order, A answers as
+    IP address strings.
+    """
+    key = (name.lower(), rdtype)
+    cached = _dns_cache.get(key)
+    if cached and time.monotonic() < cached[0]:
+        return cached[1]
+    expiry = _dns_negative.get(key)
+    if expiry is not None:
+        if time.monotonic() < expiry:
+            raise DestinationUnavailable(f"{key[0]} has no {rdtype} records")
+        del _dns_negative[key]
+    pending = _dns_inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    pending = asyncio.get_running_loop().create_future()
+    _dns_inflight[key] = pending
+    try:
+        answers = await _resolver.resolve(key[0], rdtype)
+        result = _parse_answers(rdtype, answers)
+        ttl = min(answers.rrset.ttl, DNS_CACHE_MAX_TTL)
+        if len(_dns_cache) >= DNS_CACHE_MAX_SIZE:
+            # Drop the oldest entry; dicts preserve insertion order.
+            _dns_cache.pop(next(iter(_dns_cache)))
+        _dns_cache[key] = (time.monotonic() + ttl, result)
+        pending.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        pending.cancel()
+        raise
+    except Exception as exc:
+        if isinstance(exc, (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer)):
+            logging.warning(
+                "No %s records for %s; skipping it for %ss",
+                rdtype,
+                key[0],
+                BAD_DOMAIN_TTL,
+            )
+            if len(_dns_negative) >= DNS_CACHE_MAX_SIZE:
+                _dns_negative.pop(next(iter(_dns_negative)))
+            _dns_negative[key] = time.monotonic() + BAD_DOMAIN_TTL
+        pending.set_exception(exc)
+        # Mark the exception as retrieved when nobody else is waiting.
+        pending.exception()
+        raise
+    finally:
+        del _dns_inflight[key]
+
+
+# Cheap syntax check run before any DNS or SMTP work for a recipient;
+# group 1 is the domain.
+_ADDR_RE = re.compile(r"[^@\s]{1,64}@([A-Za-z0-9.-]{1,253})")
+
+# Messages at least this large are dropped from the page cache after
+# being written.
+FADVISE_MIN_BYTES = 1024 * 1024
+
+_MSG_NAME_RE = re.compile(r"msg-(\d+)\.eml$")
+_next_msg_id: Optional[int] = None
+_msg_id_lock = threading.Lock()
+
+
+def _claim_msg_id() -> int:
+    """Return the next message number, scanning MAIL_DIR only on first use."""
+    global _next_msg_id
+    with _msg_id_lock:
+        if _next_msg_id is None:
+            os.makedirs(MAIL_DIR, exist_ok=True)
+            ids = [
+                int(m.group(1))
+                for m in map(_MSG_NAME_RE.match, os.listdir(MAIL_DIR))
+                if m
+            ]
+            _next_msg_id = max(ids, default=0) + 1
+        i = _next_msg_id
+        _next_msg_id += 1
+        return i
+
+
+def _store_message(content: bytes) -> str:
+    """Write ``content`` to a new ``msg-N.eml`` file and return its path.
+
+    The file is created with ``O_EXCL`` so a name that appeared behind our
+    back (e.g. another process sharing the volume) is skipped, not clobbered.
+    """
+    while True:
+        path = os.path.join(MAIL_DIR, f"msg-{_claim_msg_id()}.eml")
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            continue
+        break
+    # Write straight from the message buffer rather than through a
+    # BufferedWriter, which would copy large bodies once more.
+    try:
+        mv = memoryview(content)
+        while mv:
+            n = os.write(fd, mv)
+            mv = mv[n:]
+        if len(content) >= FADVISE_MIN_BYTES and hasattr(os, "posix_fadvise"):
+            # Big messages are rarely read back soon; keep them from
+            # pushing hotter data out of the page cache.
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return path
+
+
+# Accepted messages wait here for a delivery worker. The queue is bounded
+# so a stalled upstream eventually pushes back on incoming SMTP clients.
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", "8"))
+DELIVERY_QUEUE_SIZE = int(os.getenv("DELIVERY_QUEUE_SIZE", "1000"))
+# How long shutdown waits for queued deliveries before abandoning them.
+# Docker sends SIGKILL 10s after SIGTERM by default, so stay under that.
+DELIVERY_DRAIN_TIMEOUT = float(os.getenv("DELIVERY_DRAIN_TIMEOUT", "8"))
+
+
 class StoreHandler:
+    def __init__(self) -> None:
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._in_flight = 0
+
     async def handle_DATA(self, server, session, envelope):
-        """Store message locally then attempt MX delivery for each RCPT TO.
+        """Store message locally and queue it for MX delivery.
 
         This function writes the raw message to disk (so there's always a
-        local copy) and then tries to deliver the message to the recipient's
-        MX servers (simple algorithm: try MX hosts in priority order). Any
-        delivery failures are logged; failures do not remove the local copy.
+        local copy) before replying, then hands it to a background worker
+        which tries to deliver it to each recipient's MX servers (simple
+        algorithm: try MX hosts in priority order). Any delivery failures
+        are logged; failures do not remove the local copy.
         """
-        os.makedirs(MAIL_DIR, exist_ok=True)
-        i = 1
-        while True:
-            path = os.path.join(MAIL_DIR, f"msg-{i}.eml")
-            if not os.path.exists(path):
-                break
-            i += 1
-        # Write local copy
+        # Write local copy. The disk write runs in the default executor so
+        # it doesn't stall other SMTP sessions on the event loop.
+        loop = asyncio.get_running_loop()
         try:
-            with open(path, "wb") as fh:
-                fh.write(envelope.content)
+            await loop.run_in_executor(None, _store_message, envelope.content)
         except Exception:
             logging.exception("Failed to store message")
             return "451 Could not store message"
 
-        # Attempt MX delivery for each recipient
-        for rcpt in envelope.rcpt_tos:  # type: ignore[attr-defined]
+        # Delivery happens after we've replied, so the client's DATA round
+        # trip doesn't include the outbound SMTP sessions.
+        rcpts = list(envelope.rcpt_tos)  # type: ignore[attr-defined]
+        await self._delivery_queue().put((envelope.content, rcpts))
+
+        return "250 Message accepted for delivery"
+
+    def _delivery_queue(self) -> asyncio.Queue:
+        """Return the delivery queue, starting workers on first use.
+
+        Created lazily so the queue and tasks belong to the controller's
+        event loop rather than whichever loop existed at construction.
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=DELIVERY_QUEUE_SIZE)
+            loop = asyncio.get_running_loop()
+            self._workers = [
+                loop.create_task(self._delivery_worker())
+                for _ in range(DELIVERY_WORKERS)
+            ]
+        return self._queue
+
+    async def _delivery_worker(self) -> None:
+        assert self._queue is not None
+        while True:
+            content, rcpts = await self._queue.get()
+            self._in_flight += 1
             try:
-                self._deliver_to_recipient(rcpt, envelope.content)
+                await self._deliver_message(content, rcpts)
             except Exception:
-                logging.exception("Delivery attempt failed for %s", rcpt)
+                logging.exception("Delivery worker failed")
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
 
-        return "250 Message accepted for delivery"
+    async def drain(self, timeout: float) -> None:
+        """Wait up to ``timeout`` seconds for queued deliveries to finish.
 
-    def _get_mx_hosts(self, domain: str) -> List[str]:
-        """Return MX hostnames for domain ordered by priority."""
-        answers = dns.resolver.resolve(domain, "MX")
-        # MX records are tuples (priority, host)
-        mx = sorted([(r.preference, str(r.exchange).rstrip(".")) for r in answers])
-        return [host for _, host in mx]
+        Delivery is at most once: anything still queued or in progress
+        when this gives up is dropped (its local copy stays in MAIL_DIR
+        but is not retried), so the count is logged.
+        """
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(
+                "Shutting down with %d queued and %d in-progress deliveries "
+                "abandoned; their local copies remain in %s",
+                self._queue.qsize(),
+                self._in_flight,
+                MAIL_DIR,
+            )
+
+    async def _deliver_message(self, content: bytes, rcpts: List[str]) -> None:
+        """Attempt MX delivery for all recipients concurrently."""
+        results = await asyncio.gather(
+            *(self._deliver_to_recipient(rcpt, content) for rcpt in rcpts),
+            return_exceptions=True,
+        )
+        for rcpt, result in zip(rcpts, results):
+            if isinstance(result, DestinationUnavailable):
+                # Already logged when the destination was marked bad.
+                logging.debug("Skipped delivery to %s: %s", rcpt, result)
+            elif isinstance(result, BaseException):
+                logging.error(
+                    "Delivery attempt failed for %s", rcpt, exc_info=result
+                )
+
+    async def _get_mx_hosts(self, domain: str) -> List[str]:
+        """Return MX hostnames for domain ordered by priority.
 
-    def _deliver_to_recipient(self, rcpt: str, content: bytes) -> None:
+        Results are served from ``_dns_cache`` while their TTL is valid.
+        """
+        return await _resolve_cached(domain, "MX")
+
+    async def _get_mx_addresses(self, domain: str) -> List[Tuple[str, List[str]]]:
+        """Return ``(mx_host, [ipv4, ...])`` pairs in MX priority order.
+
+        A records for every MX host are resolved concurrently so falling
+        back to the next host doesn't wait on another lookup. A host whose
+        A lookup fails gets an empty list and is connected to by name.
+        """
+        mx_hosts = await self._get_mx_hosts(domain)
+        addrs = await asyncio.gather(
+            *(_resolve_cached(host, "A") for host in mx_hosts),
+            return_exceptions=True,
+        )
+        return [
+            (host, [] if isinstance(ips, BaseException) else ips)
+            for host, ips in zip(mx_hosts, addrs)
+        ]
+
+    async def _deliver_to_recipient(self, rcpt: str, content: bytes) -> None:
         """Resolve MX for the recipient domain and attempt SMTP delivery.
 
-        This performs a simple connect/send sequence using smtplib.SMTP
-        to the MX host on port 25. It does not implement retries or backoff.
+        Connections come from the shared :class:`SMTPPool`, so consecutive
+        messages to the same relay or MX host reuse one session. Each send
+        first waits on its destination's rate limit; the pool then hands out
+        a global delivery slot only once the host's own slot is free, so a
+        throttled or busy destination can't starve the others. It does not
+        implement retries or backoff.
         """
+        m = _ADDR_RE.fullmatch(rcpt)
+        if not m:
+            logging.warning("Not delivering to malformed address %r", rcpt)
+            return
+        domain = m.group(1)
+
         # Prefer an authenticated outbound relay when configured. This
         # allows using smtp.gmail.com (with an app password) which will
         # typically accept delivery even when direct-to-MX is blocked.
-        relay_host = os.getenv("SMTP_RELAY_SERVER")
-        relay_port = (
-            int(os.getenv("SMTP_RELAY_PORT")) if os.getenv("SMTP_RELAY_PORT") else 0
-        )
-        relay_user = os.getenv("SMTP_RELAY_USERNAME")
-        relay_pass = os.getenv("SMTP_RELAY_PASSWORD")
-        relay_starttls = os.getenv("SMTP_RELAY_STARTTLS", "1") in ("1", "true", "True")
-
-        if relay_host:
+        port = RELAY.port or 587
+        if RELAY.host and not _host_is_down(RELAY.host, port):
             try:
-                port = relay_port or 587
                 logging.info(
-                    "Using outbound relay %s:%s for %s", relay_host, port, rcpt
+                    "Using outbound relay %s:%s for %s", RELAY.host, port, rcpt
                 )
-                with smtplib.SMTP(relay_host, port, timeout=60) as s:
-                    s.ehlo("local-relay")
-                    if relay_starttls:
-                        s.starttls()
-                        s.ehlo()
-                    if relay_user and relay_pass:
-                        s.login(relay_user, relay_pass)
-                    s.sendmail(envelope_from(content), [rcpt], content)
-                logging.info("Delivered message to %s via relay %s", rcpt, relay_host)
+                await _throttle(RELAY.host)
+                async with _pool.connection(
+                    RELAY.host,
+                    port,
+                    RELAY.user,
+                    RELAY.password,
+                    starttls=RELAY.starttls,
+                    timeout=60,
+                ) as s:
+                    await s.sendmail(envelope_from(content), [rcpt], content)
+                logging.info("Delivered message to %s via relay %s", rcpt, RELAY.host)
                 return
             except Exception as exc:
+                if _is_connect_failure(exc):
+                    _mark_host_down(RELAY.host, port, exc)
                 logging.exception(
-                    "Relay delivery to %s via %s failed", rcpt, relay_host
+                    "Relay delivery to %s via %s failed", rcpt, RELAY.host
                 )
 
         # Fallback to direct MX delivery
-        domain = rcpt.split("@", 1)[1]
-        mx_hosts = self._get_mx_hosts(domain)
-        if not mx_hosts:
+        mx_addrs = await self._get_mx_addresses(domain)
+        if not mx_addrs:
             raise RuntimeError(f"No MX hosts found for {domain}")
+        candidates = [
+            (host, address)
+            for host, ips in mx_addrs
+            for address in ips or [host]
+            if not _host_is_down(address, 25)
+        ]
+        if not candidates:
+            raise DestinationUnavailable(f"All MX hosts for {domain} are marked down")
+        # Only spend a rate-limit token once there is somewhere to send to.
+        await _throttle(domain)
 
-        last_exc = None
-        for host in mx_hosts:
+        last_exc: Optional[Exception] = None
+        for host, address in candidates:
             try:
                 logging.info(
-                    "Attempting delivery of %s to %s (MX %s)", rcpt, domain, host
+                    "Attempting delivery of %s to %s (MX %s, %s)",
+                    rcpt,
+                    domain,
+                    host,
+                    address,
                 )
-                with smtplib.SMTP(host, 25, timeout=30) as s:
-                    # Announce a reasonable EHLO name
-                    s.ehlo("local-relay")
-                    s.sendmail(envelope_from(content), [rcpt], content)
+                async with _pool.connection(
+                    host, 25, address=address, timeout=30
+                ) as s:
+                    await s.sendmail(envelope_from(content), [rcpt], content)
                 logging.info("Delivered message to %s via %s", rcpt, host)
                 return
             except Exception as exc:
                 last_exc = exc
-                logging.warning("Delivery to %s via %s failed: %s", rcpt, host, exc)
+                if _is_connect_failure(exc):
+                    _mark_host_down(address, 25, exc)
+                logging.warning(
+                    "Delivery to %s via %s (%s) failed: %s", rcpt, host, address, exc
+                )
         # All MX attempts failed
-        raise last_exc or RuntimeError("MX delivery failed")
+        assert last_exc is not None
+        raise last_exc
+
+
+# Only the header block is searched for From:, and never more than
+# HEADER_SCAN_LIMIT bytes of it, so the cost doesn't grow with attachments.
+HEADER_SCAN_LIMIT = 16384
+_FROM_RE = re.compile(rb"(?mi)^From:[ \t]*(.+?)\r?$")
+_ANGLE_ADDR_RE = re.compile(rb"<([^>]+)>")
+_header_parser = BytesHeaderParser()
+
+
+def _header_end(content: bytes) -> int:
+    """Return the offset of the blank line ending the headers (bounded)."""
+    end = content.find(b"\r\n\r\n", 0, HEADER_SCAN_LIMIT)
+    if end < 0:
+        end = content.find(b"\n\n", 0, HEADER_SCAN_LIMIT)
+    if end < 0:
+        end = min(len(content), HEADER_SCAN_LIMIT)
+    return end
 
 
 def envelope_from(content: bytes) -> str:
@@ -137,11 +717,23 @@ def envelope_from(content: bytes) -> str:
     # If an authenticated outbound relay is configured, prefer its username
     # as the envelope-from (many relays require the MAIL FROM to match
     # the authenticated account or an approved alias).
-    relay_user = os.getenv("SMTP_RELAY_USERNAME")
-    if relay_user:
-        return relay_user
+    if RELAY.user:
+        return RELAY.user
+    m = _FROM_RE.search(content, 0, _header_end(content))
+    if m:
+        frm = m.group(1)
+        addr = _ANGLE_ADDR_RE.search(frm)
+        if addr:
+            return addr.group(1).decode("utf8", errors="replace")
+        frm = frm.strip()
+        if b"@" in frm:
+            return frm.split()[-1].decode("utf8", errors="replace")
+        if frm:
+            return frm.decode("utf8", errors="replace")
+    # No usable From: line (e.g. a folded header); let the email package
+    # parse the header block, and only that, before giving up.
     try:
-        msg = email.message_from_bytes(content)
+        msg = _header_parser.parsebytes(content[: _header_end(content)])
         frm = msg.get("From")
         if frm:
             # Attempt a naive extraction of email address
@@ -156,32 +748,71 @@ def envelope_from(content: bytes) -> str:
 app = FastAPI()
 
 
-@app.get("/messages", response_class=PlainTextResponse)
-def list_messages():
-    if not os.path.isdir(MAIL_DIR):
-        return "No messages"
-    files = sorted(os.listdir(MAIL_DIR))
-    out = []
-    for fname in files:
+# Only the start of each stored message is shown, so there's no need to
+# read beyond a header-sized chunk.
+PREVIEW_BYTES = 8192
+PREVIEW_LINES = 20
+
+
+async def _preview_sections(files: List[str]) -> AsyncIterator[str]:
+    for n, fname in enumerate(files):
         p = os.path.join(MAIL_DIR, fname)
-        with open(p, "r", encoding="utf8") as fh:
-            hdr = fh.read().splitlines()[:20]
-        out.append(f"--- {fname} ---\n" + "\n".join(hdr))
-    return "\n\n".join(out) or "No messages"
+        async with aiofiles.open(p, "rb") as fh:
+            head = await fh.read(PREVIEW_BYTES)
+        hdr = head.decode("utf8", errors="replace").splitlines()[:PREVIEW_LINES]
+        yield ("\n\n" if n else "") + f"--- {fname} ---\n" + "\n".join(hdr)
+
+
+@app.get("/messages", response_class=PlainTextResponse)
+async def list_messages():
+    if not await aiofiles.os.path.isdir(MAIL_DIR):
+        return PlainTextResponse("No messages")
+    files = sorted(await aiofiles.os.listdir(MAIL_DIR))
+    if not files:
+        return PlainTextResponse("No messages")
+    return StreamingResponse(_preview_sections(files), media_type="text/plain")
+
+
+# Largest message body accepted on DATA; anything bigger gets a 552. The
+# default matches aiosmtpd's own (32 MiB).
+DATA_SIZE_LIMIT = int(os.getenv("SMTP_DATA_SIZE_LIMIT", str(32 * 1024 * 1024)))
 
 
 def start_smtp(loop):
     handler = StoreHandler()
-    controller = Controller(handler, hostname="0.0.0.0", port=25)
+    # Everything except the size limit is left at aiosmtpd's defaults; the
+    # limit is only made configurable via SMTP_DATA_SIZE_LIMIT.
+    controller = Controller(
+        handler, hostname="0.0.0.0", port=25, data_size_limit=DATA_SIZE_LIMIT
+    )
     controller.start()
     return controller
 
 
+def stop_smtp(controller) -> None:
+    """Let queued deliveries finish (bounded), then stop the controller."""
+    drain = controller.handler.drain(DELIVERY_DRAIN_TIMEOUT)
+    asyncio.run_coroutine_threadsafe(drain, controller.loop).result()
+    controller.stop()
+
+
 if __name__ == "__main__":
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     controller = start_smtp(loop)
+    # The SMTP controller stays in this process; with more than one worker
+    # uvicorn serves the HTTP API from child processes that only read
+    # MAIL_DIR, so they don't need the controller.
+    workers = int(os.getenv("HTTP_WORKERS", str(min(4, os.cpu_count() or 1))))
     try:
-        uvicorn.run(app, host="0.0.0.0", port=8025)
+        uvicorn.run(
+            "app:app" if workers > 1 else app,
+            host="0.0.0.0",
+            port=8025,
+            loop="uvloop",
+            http="httptools",
+            workers=workers,
+            log_level="warning",
+        )
     finally:
-        controller.stop()
+        stop_smtp(controller)
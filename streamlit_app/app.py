@@ -5,10 +5,25 @@ long as the necessary environment variables are defined.
 """
 
 import os
+
+import requests
 import streamlit as st
 
 from email_utils import get_smtp_config, send_email
 
+RELAY_API_URL = "http://smtp_relay:8025"
+
+
+@st.cache_resource
+def _relay_session() -> requests.Session:
+    """Return an HTTP session for the relay API.
+
+    Streamlit re-runs this script on every interaction, so the
+    session is cached as a resource to keep its pooled
+    connection alive between clicks.
+    """
+    return requests.Session()
+
 
 def main() -> None:
     """Render the Streamlit UI and handle form submission."""
@@ -34,9 +49,7 @@ def main() -> None:
     # Small convenience: preview messages stored by the local relay
     if st.button("Preview stored messages"):
         try:
-            import requests
-
-            resp = requests.get("http://smtp_relay:8025/messages", timeout=5)
+            resp = _relay_session().get(f"{RELAY_API_URL}/messages", timeout=5)
             st.text(resp.text)
         except Exception as exc:
             st.error(f"Could not fetch stored messages: {exc}")
@@ -1,6 +1,6 @@
 """Utility functions for sending email via SMTP.
 
-This module exposes two helper functions:
+This module exposes the following helpers:
 
 * :func:`get_smtp_config` reads the SMTP server
   configuration from environment variables.  It ensures
@@ -16,6 +16,13 @@ This module exposes two helper functions:
   sender is provided the username will be used as the
   ``From`` address.
 
+* :func:`send_batch` sends a list of :class:`EmailMsg`
+  over a single SMTP connection, issuing ``RSET``
+  between messages and pipelining ``MAIL FROM`` /
+  ``RCPT TO`` when the server advertises PIPELINING.
+  :func:`send_many` is a thin wrapper taking plain
+  ``(recipient, subject, body)`` tuples.
+
 These functions are designed to be composable and
 reusable from the Streamlit front-end or any other
 Python code.  They raise exceptions on misconfigured
@@ -31,13 +38,34 @@ things simple for clarity.
 """
 
 import os
+import re
 import smtplib
+from contextlib import contextmanager
+from email import policy
 from email.mime.text import MIMEText
-from typing import Tuple, Optional
+from typing import (
+    Callable,
+    ContextManager,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Tuple,
+    Optional,
+)
 
 from dotenv import load_dotenv
 
 
+class EmailMsg(NamedTuple):
+    """A plain text email queued for :func:`send_batch`."""
+
+    recipient: str
+    subject: str
+    body: str
+
+
 def get_smtp_config() -> Tuple[str, int, Optional[str], Optional[str], str, bool]:
     """Load SMTP configuration from environment variables.
 
@@ -95,6 +123,106 @@ def get_smtp_config() -> Tuple[str, int, Optional[str], Optional[str], str, bool
     return server, port, username, password, sender, no_auth
 
 
+# The compat32 policy MIMEText uses (so non-ASCII headers
+# are still RFC 2047 encoded), but with CRLF line endings
+# so smtplib can send the bytes as-is.
+_WIRE_POLICY = policy.compat32.clone(linesep="\r\n")
+
+
+def _build_message(recipient: str, subject: str, body: str, sender: str) -> bytes:
+    """Return the wire-format bytes of a plain text email."""
+    # Construct MIMEText message.  Using MIME classes
+    # simplifies adding future headers such as CC/BCC.
+    message = MIMEText(body, "plain", _charset="utf-8")
+    message["Subject"] = subject
+    message["From"] = sender
+    message["To"] = recipient
+    return message.as_bytes(policy=_WIRE_POLICY)
+
+
+# Use a short timeout to avoid long hangs.
+_TIMEOUT = 30
+
+
+# A bare RFC 5321 addr-spec with an unquoted local part;
+# safe to splice into a header verbatim.
+_PLAIN_ADDR_RE = re.compile(r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~.-]+@[A-Za-z0-9.-]+")
+
+
+def _message_builder(subject: str, body: str, sender: str) -> Callable[[str], bytes]:
+    """Return a function producing :func:`_build_message` output per recipient.
+
+    The MIME body and the other headers are serialised
+    once; each call only splices the ``To`` header (which
+    the generator emits last) onto the cached bytes.
+    Only short, plain ``local@domain`` recipients take this
+    path; anything else (including CR/LF, which would inject
+    headers) goes through the full build, which encodes,
+    folds or rejects it.
+    """
+    message = MIMEText(body, "plain", _charset="utf-8")
+    message["Subject"] = subject
+    message["From"] = sender
+    head, sep, rest = message.as_bytes(policy=_WIRE_POLICY).partition(b"\r\n\r\n")
+
+    def build(recipient: str) -> bytes:
+        if len(recipient) < 70 and _PLAIN_ADDR_RE.fullmatch(recipient):
+            return b"".join((head, b"\r\nTo: ", recipient.encode("ascii"), sep, rest))
+        return _build_message(recipient, subject, body, sender)
+
+    return build
+
+
+@contextmanager
+def _connect_plain(
+    smtp_server: str, smtp_port: int, username: Optional[str], password: Optional[str]
+) -> Iterator[smtplib.SMTP]:
+    # Unauthenticated relay (e.g. a local container on port 25):
+    # no STARTTLS / LOGIN.
+    with smtplib.SMTP(host=smtp_server, port=smtp_port, timeout=_TIMEOUT) as server:
+        yield server
+
+
+@contextmanager
+def _connect_ssl(
+    smtp_server: str, smtp_port: int, username: Optional[str], password: Optional[str]
+) -> Iterator[smtplib.SMTP]:
+    # Port 465 uses implicit SSL.
+    with smtplib.SMTP_SSL(host=smtp_server, port=smtp_port, timeout=_TIMEOUT) as server:
+        server.login(username, password)
+        yield server
+
+
+@contextmanager
+def _connect_starttls(
+    smtp_server: str, smtp_port: int, username: Optional[str], password: Optional[str]
+) -> Iterator[smtplib.SMTP]:
+    # Other ports are upgraded via STARTTLS.
+    with smtplib.SMTP(host=smtp_server, port=smtp_port, timeout=_TIMEOUT) as server:
+        server.ehlo()
+        server.starttls()
+        server.ehlo()
+        server.login(username, password)
+        yield server
+
+
+def _connect(
+    smtp_server: str,
+    smtp_port: int,
+    username: Optional[str],
+    password: Optional[str],
+    no_auth: bool,
+) -> ContextManager[smtplib.SMTP]:
+    """Open an SMTP connection that is ready to send mail."""
+    if no_auth or smtp_port == 25:
+        connect = _connect_plain
+    elif smtp_port == 465:
+        connect = _connect_ssl
+    else:
+        connect = _connect_starttls
+    return connect(smtp_server, smtp_port, username, password)
+
+
 def send_email(
     recipient: str,
     subject: str,
@@ -113,7 +241,7 @@ def send_email(
     ----------
     recipient : str
         Destination email address.  Should be a valid
-        RFC 2822 address.
+        RFC 2822 address.
     subject : str
         Message subject line.
     body : str
@@ -138,33 +266,134 @@ def send_email(
     """
     if sender is None:
         sender = username
-    # Construct MIMEText message.  Using MIME classes
-    # simplifies adding future headers such as CC/BCC.
-    message = MIMEText(body, "plain", _charset="utf-8")
-    message["Subject"] = subject
-    message["From"] = sender
-    message["To"] = recipient
-    # Choose SSL vs TLS based on port.  Port 465 uses
-    # implicit SSL while other ports are upgraded via
-    # STARTTLS.  Use a short timeout to avoid long hangs.
-    timeout = 30
-    # If the relay is configured to accept unauthenticated mail (e.g.
-    # a local container on port 25) we send without STARTTLS / LOGIN.
-    if no_auth or smtp_port == 25:
-        with smtplib.SMTP(host=smtp_server, port=smtp_port, timeout=timeout) as server:
-            server.sendmail(sender, [recipient], message.as_string())
-        return
-
-    if smtp_port == 465:
-        with smtplib.SMTP_SSL(
-            host=smtp_server, port=smtp_port, timeout=timeout
-        ) as server:
-            server.login(username, password)
-            server.sendmail(sender, [recipient], message.as_string())
+    raw = _build_message(recipient, subject, body, sender)
+    with _connect(smtp_server, smtp_port, username, password, no_auth) as server:
+        server.sendmail(sender, [recipient], raw)
+
+
+def _send_envelope(
+    server: smtplib.SMTP, sender: str, recipient: str, pipelining: bool
+) -> None:
+    """Send MAIL FROM / RCPT TO for one transaction on an open connection."""
+    if pipelining:
+        # Send the envelope in one burst and collect both replies
+        # afterwards, saving a round trip per message.
+        server.send(
+            f"MAIL FROM:{smtplib.quoteaddr(sender)}\r\n"
+            f"RCPT TO:{smtplib.quoteaddr(recipient)}\r\n"
+        )
+        mail_reply = server.getreply()
+        rcpt_reply = server.getreply()
     else:
-        with smtplib.SMTP(host=smtp_server, port=smtp_port, timeout=timeout) as server:
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            server.login(username, password)
-            server.sendmail(sender, [recipient], message.as_string())
+        mail_reply = server.mail(sender)
+        rcpt_reply = server.rcpt(recipient) if mail_reply[0] == 250 else None
+    if mail_reply[0] != 250:
+        server.rset()
+        raise smtplib.SMTPSenderRefused(mail_reply[0], mail_reply[1], sender)
+    if rcpt_reply[0] not in (250, 251):
+        server.rset()
+        raise smtplib.SMTPRecipientsRefused({recipient: rcpt_reply})
+
+
+def send_batch(
+    msgs: List[EmailMsg],
+    *,
+    smtp_server: str,
+    smtp_port: int,
+    username: Optional[str],
+    password: Optional[str],
+    sender: Optional[str] = None,
+    no_auth: bool = False,
+) -> None:
+    """Send several plain text emails over one SMTP connection.
+
+    The connection is opened and authenticated once; each
+    message is then sent as its own transaction with
+    ``RSET`` in between.  Some servers treat ``RSET`` as
+    ``QUIT``: they answer something other than 250 or hang
+    up before the next ``MAIL FROM``.  When that happens
+    the rest of the batch falls back to one connection per
+    message.
+
+    Parameters
+    ----------
+    msgs : list of EmailMsg
+        The emails to send, in order.
+
+    The remaining keyword arguments are the same as for
+    :func:`send_email`.
+
+    Raises
+    ------
+    smtplib.SMTPException
+        If authentication or any send fails.  Messages
+        before the failing one have already been sent.
+    """
+    if sender is None:
+        sender = username
+    pending = list(msgs)
+    builders: Dict[Tuple[str, str], Callable[[str], bytes]] = {}
+
+    def build(msg: EmailMsg) -> bytes:
+        key = (msg.subject, msg.body)
+        if key not in builders:
+            builders[key] = _message_builder(msg.subject, msg.body, sender)
+        return builders[key](msg.recipient)
+
+    with _connect(smtp_server, smtp_port, username, password, no_auth) as server:
+        server.ehlo_or_helo_if_needed()
+        pipelining = server.has_extn("pipelining")
+        first = True
+        while pending:
+            msg = pending[0]
+            if not first:
+                try:
+                    code, _ = server.rset()
+                except smtplib.SMTPServerDisconnected:
+                    break
+                if code != 250:
+                    break
+            raw = build(msg)
+            try:
+                _send_envelope(server, sender, msg.recipient, pipelining)
+            except smtplib.SMTPServerDisconnected:
+                if first:
+                    raise
+                break
+            # data() only raises if DATA itself is refused; the reply to
+            # the message body has to be checked here, as sendmail() does.
+            code, resp = server.data(raw)
+            if code != 250:
+                server.rset()
+                raise smtplib.SMTPDataError(code, resp)
+            pending.pop(0)
+            first = False
+
+    # Only reached with messages left if the server ended the
+    # session on RSET.
+    for msg in pending:
+        raw = build(msg)
+        with _connect(smtp_server, smtp_port, username, password, no_auth) as server:
+            server.sendmail(sender, [msg.recipient], raw)
+
+
+def send_many(
+    messages: Iterable[Tuple[str, str, str]],
+    *,
+    smtp_server: str,
+    smtp_port: int,
+    username: Optional[str],
+    password: Optional[str],
+    sender: Optional[str] = None,
+    no_auth: bool = False,
+) -> None:
+    """Send ``(recipient, subject, body)`` tuples via :func:`send_batch`."""
+    send_batch(
+        [EmailMsg(*m) for m in messages],
+        smtp_server=smtp_server,
+        smtp_port=smtp_port,
+        username=username,
+        password=password,
+        sender=sender,
+        no_auth=no_auth,
+    )
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The Streamlit app imports its helpers as top-level modules.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "streamlit_app"))
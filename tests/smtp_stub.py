@@ -0,0 +1,129 @@
+"""A tiny scripted SMTP server for exercising the batch send logic.
+
+It speaks just enough SMTP for :mod:`smtplib` and lets a test choose
+how the server misbehaves: the reply to the message body, whether
+``RSET`` ends the session, and whether the server hangs up on the
+next ``MAIL FROM``.
+"""
+
+import socket
+import socketserver
+import threading
+from typing import List, Tuple
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(
+        self,
+        *,
+        pipelining: bool = False,
+        data_code: int = 250,
+        rset_quits: bool = False,
+        hangup_on_second_mail: bool = False,
+    ):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.pipelining = pipelining
+        self.data_code = data_code
+        self.rset_quits = rset_quits
+        self.hangup_on_second_mail = hangup_on_second_mail
+        # (envelope recipients, message bytes) per accepted DATA
+        self.delivered: List[Tuple[List[str], bytes]] = []
+        # True for each MAIL FROM whose RCPT TO arrived in the same burst
+        self.pipelined: List[bool] = []
+        self.connections = 0
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def __enter__(self) -> "StubSMTPServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class _StubHandler(socketserver.BaseRequestHandler):
+    server: StubSMTPServer
+
+    def setup(self) -> None:
+        self.buf = b""
+        self.server.connections += 1
+
+    def _readline(self) -> bytes:
+        while b"\r\n" not in self.buf:
+            chunk = self.request.recv(65536)
+            if not chunk:
+                raise ConnectionError
+            self.buf += chunk
+        line, self.buf = self.buf.split(b"\r\n", 1)
+        return line
+
+    def _reply(self, text: str) -> None:
+        self.request.sendall(text.encode() + b"\r\n")
+
+    def _hang_up(self) -> None:
+        self.request.shutdown(socket.SHUT_RDWR)
+
+    def handle(self) -> None:
+        srv = self.server
+        mails = 0
+        rcpts: List[str] = []
+        self._reply("220 stub ready")
+        try:
+            while True:
+                line = self._readline()
+                verb = line[:4].upper()
+                if verb == b"EHLO":
+                    if srv.pipelining:
+                        self._reply("250-stub\r\n250 PIPELINING")
+                    else:
+                        self._reply("250 stub")
+                elif verb == b"HELO":
+                    self._reply("250 stub")
+                elif verb == b"MAIL":
+                    mails += 1
+                    if srv.hangup_on_second_mail and mails > 1:
+                        self._hang_up()
+                        return
+                    srv.pipelined.append(self.buf.upper().startswith(b"RCPT"))
+                    rcpts = []
+                    self._reply("250 OK")
+                elif verb == b"RCPT":
+                    rcpts.append(line.split(b":", 1)[1].strip(b" <>").decode())
+                    self._reply("250 OK")
+                elif verb == b"DATA":
+                    self._reply("354 go ahead")
+                    body = []
+                    while True:
+                        data_line = self._readline()
+                        if data_line == b".":
+                            break
+                        body.append(data_line)
+                    if srv.data_code == 250:
+                        srv.delivered.append((rcpts, b"\r\n".join(body)))
+                        self._reply("250 queued")
+                    else:
+                        self._reply(f"{srv.data_code} rejected")
+                elif verb == b"RSET":
+                    if srv.rset_quits:
+                        self._reply("221 bye")
+                        self._hang_up()
+                        return
+                    rcpts = []
+                    self._reply("250 OK")
+                elif verb == b"NOOP":
+                    self._reply("250 OK")
+                elif verb == b"QUIT":
+                    self._reply("221 bye")
+                    return
+                else:
+                    self._reply("502 not implemented")
+        except (ConnectionError, OSError):
+            return
@@ -0,0 +1,95 @@
+import smtplib
+from email.errors import HeaderParseError
+
+import pytest
+
+from email_utils import EmailMsg, _build_message, _message_builder, send_batch
+from smtp_stub import StubSMTPServer
+
+SUBJECT = "Hi there é"
+BODY = "body\nline"
+SENDER = "notifier@local.test"
+
+
+@pytest.mark.parametrize(
+    "recipient",
+    [
+        "user@example.com",
+        "first.last+tag@sub.example.org",
+        "a-very-long-local-part-that-forces-the-slow-path@a-long-domain.example.com",
+        "üser@example.de",
+    ],
+)
+def test_message_builder_matches_full_build(recipient):
+    build = _message_builder(SUBJECT, BODY, SENDER)
+    assert build(recipient) == _build_message(recipient, SUBJECT, BODY, SENDER)
+
+
+@pytest.mark.parametrize(
+    "recipient", ["bob\r\nBcc: evil@x.com", "bob\nBcc: evil@x.com"]
+)
+def test_message_builder_rejects_header_injection(recipient):
+    build = _message_builder(SUBJECT, BODY, SENDER)
+    with pytest.raises(HeaderParseError):
+        build(recipient)
+
+
+BATCH = [
+    EmailMsg("one@example.com", "s1", "b1"),
+    EmailMsg("two@example.com", "s2", "b2"),
+    EmailMsg("three@example.com", "s3", "b3"),
+]
+
+
+def _send(server, msgs=BATCH):
+    send_batch(
+        msgs,
+        smtp_server="127.0.0.1",
+        smtp_port=server.port,
+        username=None,
+        password=None,
+        sender=SENDER,
+        no_auth=True,
+    )
+
+
+def _recipients(server):
+    return [rcpts for rcpts, _ in server.delivered]
+
+
+def test_send_batch_reuses_one_connection():
+    with StubSMTPServer() as server:
+        _send(server)
+    assert _recipients(server) == [[m.recipient] for m in BATCH]
+    assert server.connections == 1
+    assert server.pipelined == [False, False, False]
+
+
+def test_send_batch_pipelines_envelope_when_advertised():
+    with StubSMTPServer(pipelining=True) as server:
+        _send(server)
+    assert _recipients(server) == [[m.recipient] for m in BATCH]
+    assert server.pipelined == [True, True, True]
+
+
+def test_send_batch_raises_when_message_body_is_rejected():
+    with StubSMTPServer(data_code=554) as server:
+        with pytest.raises(smtplib.SMTPDataError) as info:
+            _send(server)
+    assert info.value.smtp_code == 554
+    assert server.delivered == []
+
+
+def test_send_batch_falls_back_when_rset_ends_session():
+    with StubSMTPServer(rset_quits=True) as server:
+        _send(server)
+    assert _recipients(server) == [[m.recipient] for m in BATCH]
+    # The batch connection plus one per remaining message.
+    assert server.connections == 3
+
+
+def test_send_batch_falls_back_on_hangup_before_next_mail():
+    with StubSMTPServer(hangup_on_second_mail=True) as server:
+        _send(server)
+    assert _recipients(server) == [[m.recipient] for m in BATCH]
+    assert server.connections == 3